@@ -22,15 +22,32 @@ class w_packet:
         Frequencies contained in the packet.
     amplitudes : array/list
         Amplitudes associated to the frequencies.
+        The sorted indices used by components_df are cached and recalculated only when 
+        freqs or amplitudes are assigned: the arrays must not be modified in place (assign 
+        a modified copy instead, e.g. packet.freqs = new_freqs).
     disp : list
-        Function describing the dispersion relation and its optional arguments
+        Function describing the dispersion relation and its optional arguments (None if
+        the packet is a sum of packets with different dispersion relations)
+    disp_blocks : list
+        Only for sums of packets with different dispersion relations (otherwise None): 
+        list of pairs (number of components, disp), one for each block of consecutive
+        components sharing the same dispersion relation
+    phases : array
+        Phases associated to the frequencies (zero unless the packet has been shifted).
+        They are reset to zero when freqs is assigned an array of a different size.
         
     Methods
     -------
+    shift(dx, dt)
+    wavenumbers()
+    components_df(**kwargs)
     display_components_df(**kwargs)
+    export_components(pathname, **kwargs)
     generate_wave_x(x, t, **kwargs)
     generate_wave_t(t, x, **kwargs)
+    generate_wave(x, t, **kwargs)
     wave(axis, **kwargs)
+    animation_frames(d, step, xx, **kwargs)
     animate(d, step, xx, **kwargs)
     power_spectrum(t, x)
     """
@@ -57,11 +74,278 @@ class w_packet:
         if len(f) != len(A):
             raise AttributeError("Make sure that the arrays of frequencies and amplitudes have the same sizes")
             return
+        self._order_cache = {} #cached sorted indices of the components
         self.freqs = f 
         self.amplitudes = A 
         self.disp = [k] #dispersion relation of the packet
         for key, value in kwargs.items():
            self.disp.append(value) #optional arguments for the dispersion relation
+        self.disp_blocks = None #blocks of components with different dispersion relations
+        self.phases = np.zeros(len(f)) #phases of the components, changed only by shift
+
+    @property
+    def freqs(self):
+        return self._freqs
+
+    @freqs.setter
+    def freqs(self, f):
+        self._freqs = f
+        self._order_cache.pop('freq', None)
+        if (getattr(self, 'phases', None) is not None) and (len(self.phases) != len(f)):
+            self.phases = np.zeros(len(f)) #the old phases belong to other components
+
+    def _check_sizes(self):
+        """
+        This method checks that frequencies, amplitudes, phases and blocks of dispersion
+        relations describe the same number of components.
+        """
+        n = len(self.freqs)
+        if (len(self.amplitudes) != n) or (len(self.phases) != n):
+            raise AttributeError("Make sure that the arrays of frequencies and amplitudes have the same sizes")
+            return
+        if (self.disp_blocks is not None) and (sum(m for m, disp in self.disp_blocks) != n):
+            raise AttributeError("The blocks of the dispersion relations do not match the number of frequencies")
+            return
+
+    @property
+    def amplitudes(self):
+        return self._amplitudes
+
+    @amplitudes.setter
+    def amplitudes(self, A):
+        self._amplitudes = A
+        self._order_cache.pop('ampl', None)
+
+    def __add__(self, other):
+        """
+        Superposition of two packets. No waveform is calculated: the components of the two
+        packets are concatenated into a new packet, which is synthesised in a single pass
+        only when a waveform or a spectrum is requested.
+
+        Parameters
+        ----------
+        other : w_packet
+            Packet to be superposed to this one.
+
+        Returns
+        -------
+        packet : w_packet
+            Packet containing the components of both packets.
+        """
+        if not isinstance(other, w_packet):
+            return NotImplemented
+        self._check_sizes()
+        other._check_sizes()
+        #each block of components keeps the dispersion relation of its packet
+        blocks = []
+        for n, disp in self._blocks() + other._blocks():
+            if (len(blocks) > 0) and _same_disp(blocks[-1][1], disp):
+                blocks[-1] = (blocks[-1][0] + n, blocks[-1][1])
+            else:
+                blocks.append((n, list(disp)))
+        packet = self._derived(np.concatenate((self.freqs, other.freqs)),
+                               np.concatenate((self.amplitudes, other.amplitudes)),
+                               np.concatenate((self.phases, other.phases)))
+        if len(blocks) == 1:
+            packet.disp, packet.disp_blocks = blocks[0][1], None
+        else:
+            packet.disp, packet.disp_blocks = None, blocks
+        return packet
+
+    def __sub__(self, other):
+        """
+        Difference of two packets, equivalent to self + (-1) * other.
+        """
+        if not isinstance(other, w_packet):
+            return NotImplemented
+        return self + (-1) * other
+
+    def __mul__(self, c):
+        """
+        Multiplication of the packet by a scalar. Only the amplitudes of the components are 
+        rescaled, no waveform is calculated.
+
+        Parameters
+        ----------
+        c : float
+            Scale factor.
+
+        Returns
+        -------
+        packet : w_packet
+            Packet with the amplitudes multiplied by c.
+        """
+        if not np.isscalar(c):
+            return NotImplemented
+        return self._derived(np.asarray(self.freqs), c * np.asarray(self.amplitudes), np.copy(self.phases))
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return (-1) * self
+
+    def shift(self, dx = 0, dt = 0):
+        """
+        This method translates the packet by dx along the x-axis and by dt along the t-axis,
+        so that the new packet at (x, t) is equal to the old one at (x - dx, t - dt). The 
+        translation is folded into the phases of the components: 
+        phi_i -> phi_i - k_i*dx + 2*pi*f_i*dt
+
+        Parameters
+        ----------
+        dx : float
+            Translation along the x-axis. Default: 0
+        dt : float
+            Translation along the t-axis. Default: 0
+
+        Returns
+        -------
+        packet : w_packet
+            Translated packet.
+        """
+        self._check_sizes()
+        freqs = np.asarray(self.freqs)
+        k = self.wavenumbers()
+        return self._derived(freqs, np.asarray(self.amplitudes), self.phases - k * dx + 2 * np.pi * freqs * dt)
+
+    def wavenumbers(self):
+        """
+        This method calculates the wave numbers of the components of the packet from their
+        frequencies, using the dispersion relation of the block each component belongs to.
+
+        Returns
+        -------
+        k : array
+            Wave numbers of the components.
+        """
+        freqs = np.asarray(self.freqs)
+        if self.disp_blocks is None:
+            return self.disp[0](freqs, *self.disp[1:])
+        if sum(n for n, disp in self.disp_blocks) != len(freqs):
+            raise AttributeError("The blocks of the dispersion relations do not match the number of frequencies")
+            return
+        k = []
+        start = 0
+        for n, disp in self.disp_blocks:
+            k.append(disp[0](freqs[start:start + n], *disp[1:]))
+            start += n
+        return np.concatenate(k)
+
+    def _blocks(self):
+        if self.disp_blocks is None:
+            return [(len(self.freqs), self.disp)]
+        return self.disp_blocks
+
+    def _derived(self, freqs, amplitudes, phases):
+        """
+        This method returns a new packet with the given components and the same dispersion
+        relation(s) of this one.
+        """
+        packet = w_packet(freqs, amplitudes, None)
+        packet.disp = None if self.disp is None else list(self.disp)
+        packet.disp_blocks = None if self.disp_blocks is None else list(self.disp_blocks)
+        packet.phases = phases
+        return packet
+
+    def _sorted_indices(self, order):
+        """
+        This method returns the indices that sort the components in the specified order 
+        ('freq': increasing frequencies, 'ampl': decreasing amplitudes). The full argsort is
+        calculated only once and cached until the frequencies or the amplitudes are assigned.
+        Components with equal values keep the order of their indices.
+        """
+        if order not in self._order_cache:
+            values = np.asarray(self.freqs if order == 'freq' else self.amplitudes)
+            if order == 'ampl':
+                values = -values
+            self._order_cache[order] = np.argsort(values, kind = 'stable')
+        return self._order_cache[order]
+
+    def _top_indices(self, n, order, subset = None):
+        """
+        This method returns the indices of the first n components in the specified order,
+        chosen among the indices in subset (default: all the components). If the full sorted
+        index is not cached, np.argpartition is used so that only n components are sorted.
+        Components with equal values keep their order in subset, as in _sorted_indices.
+        """
+        if subset is None:
+            if (order in self._order_cache) or (n >= len(self.freqs)):
+                return self._sorted_indices(order)[:n]
+            subset = np.arange(len(self.freqs))
+        values = np.asarray(self.freqs if order == 'freq' else self.amplitudes)[subset]
+        if order == 'ampl':
+            values = -values
+        if n <= 0:
+            return subset[:0]
+        if n < len(subset):
+            #argpartition picks the ties at the n-th value arbitrarily: the first ones are kept
+            last = values[np.argpartition(values, n - 1)[:n]].max()
+            below = np.flatnonzero(values < last)
+            equal = np.flatnonzero(values == last)[:n - len(below)]
+            positions = np.concatenate((below, equal))
+        else:
+            positions = np.arange(len(subset))
+        positions = positions[np.lexsort((positions, values[positions]))]
+        return subset[positions]
+
+    def _query_indices(self, **kwargs):
+        """
+        This method returns the indices of the components selected by the keyword arguments
+        order, n, fmin and fmax (see components_df).
+        """
+        if len(self.freqs) == 0:
+            raise AttributeError("Make sure that the arrays of the frequencies and the amplitudes are not empty")
+            return
+        order = kwargs.get('order', 'freq')
+        if order not in ('freq', 'ampl'):
+            raise AttributeError("{} is not a valid order".format(order))
+            return
+        n = kwargs.get('n', None)
+        if (n is not None) and (n < 0):
+            raise AttributeError("The number of components must be non negative")
+            return
+        subset = None
+        if ('fmin' in kwargs) or ('fmax' in kwargs):
+            by_freq = self._sorted_indices('freq')
+            sorted_freqs = np.asarray(self.freqs)[by_freq]
+            lo = np.searchsorted(sorted_freqs, kwargs.get('fmin', -np.inf), side = 'left')
+            hi = np.searchsorted(sorted_freqs, kwargs.get('fmax', np.inf), side = 'right')
+            subset = by_freq[lo:hi]
+            if order == 'freq':
+                return subset if n is None else subset[:n]
+        if n is None:
+            return self._sorted_indices(order) if subset is None else self._top_indices(len(subset), order, subset)
+        return self._top_indices(n, order, subset)
+
+    def components_df(self, **kwargs):
+        """
+        This method returns a dataframe with the frequencies and the amplitudes of the packet.
+        Only the selected components are copied into the dataframe.
+        
+        Parameters
+        ----------
+        **kwargs : 
+            order: string
+            - if order = 'freq' the df is in the order of increasing frequencies
+            - if order = 'ampl' the df is in the order of decreasing amplitudes
+            - default: 'freq'
+            n: int
+                Number of components in the df (the first n in the chosen order).
+                Default: all the components
+            fmin: float
+                Lowest frequency of the components in the df. Default: no limit
+            fmax: float
+                Highest frequency of the components in the df. Default: no limit
+
+        Returns
+        -------
+        df : pandas.DataFrame
+            Dataframe of the selected components.
+        """
+        indices = self._query_indices(**kwargs)
+        df = pd.DataFrame({'Frequencies (Hz)': np.asarray(self.freqs)[indices],
+                           'Amplitudes (a.u.)': np.asarray(self.amplitudes)[indices]})
+        return df
 
     def display_components_df(self, **kwargs):
         """
@@ -74,34 +358,90 @@ class w_packet:
             - if order = 'freq' the df is shown in the order of increasing frequencies
             - if order = 'ampl' the df is shown in the order of decreasing amplitudes
             - default: 'freq'
+            n: int
+                Number of components shown (e.g. n = 20 with order = 'ampl' shows the 20
+                components with the highest amplitudes). Default: all the components
+            fmin, fmax: float
+                Range of the frequencies of the components shown. Default: no limits
 
         Returns
         -------
         None.
         """
-        if len(self.freqs) == 0:
-            raise AttributeError("Make sure that the arrays of the frequencies and the amplitudes are not empty")
+        print(self.components_df(**kwargs))
+
+    def export_components(self, pathname, **kwargs):
+        """
+        This method saves the table of the components of the packet to a CSV or Parquet 
+        file, writing it in chunks so that the full dataframe is never built.
+
+        Parameters
+        ----------
+        pathname : string
+            Pathname of the file. The format is chosen from the extension (.csv or .parquet).
+        **kwargs : 
+            chunksize: int
+                Number of components written in each chunk. Default: 1000000
+            order: string
+                'freq', 'ampl' (see components_df) or None for the order in which the 
+                components are stored in the packet. Default: 'freq'
+            n, fmin, fmax: 
+                Selection of the components, as in components_df.
+
+        Returns
+        -------
+        None.
+        """
+        chunksize = int(kwargs.pop('chunksize', 1000000))
+        if chunksize <= 0:
+            raise AttributeError("The chunksize must be positive")
             return
-        indices = np.argsort(self.freqs)
-        for key, value in kwargs.items():
-            if key == 'order':
-                if value == 'freq':
-                    break
-                elif value == 'ampl':
-                    indices = np.argsort(self.amplitudes)[::-1]
+        if pathname.endswith('.csv'):
+            fmt = 'csv'
+        elif pathname.endswith('.parquet'):
+            fmt = 'parquet'
+        else:
+            raise AttributeError("{} is not a valid file format, use .csv or .parquet".format(pathname))
+            return
+        if ('order' in kwargs) and (kwargs['order'] is None):
+            kwargs.pop('order')
+            if ('n' in kwargs) or ('fmin' in kwargs) or ('fmax' in kwargs):
+                raise AttributeError("n, fmin and fmax need order = 'freq' or 'ampl'")
+                return
+            indices = None
+            size = len(self.freqs)
+        else:
+            indices = self._query_indices(**kwargs)
+            size = len(indices)
+        freqs = np.asarray(self.freqs)
+        amplitudes = np.asarray(self.amplitudes)
+        writer = None
+        try:
+            for start in range(0, max(size, 1), chunksize):
+                chunk = slice(start, start + chunksize) if indices is None else indices[start:start + chunksize]
+                df = pd.DataFrame({'Frequencies (Hz)': freqs[chunk],
+                                   'Amplitudes (a.u.)': amplitudes[chunk]})
+                if fmt == 'csv':
+                    df.to_csv(pathname, mode = 'w' if start == 0 else 'a', header = (start == 0), index = False)
                 else:
-                    raise AttributeError("{} is not a valid order".format(value))
-                    return
-        df = pd.DataFrame(columns = ['Frequencies (Hz)', 'Amplitudes (a.u.)'])
-        df['Frequencies (Hz)'] = self.freqs[indices]
-        df['Amplitudes (a.u.)'] =self.amplitudes[indices]
-        print(df)
+                    try:
+                        import pyarrow as pa
+                        import pyarrow.parquet as pq
+                    except ImportError:
+                        raise ImportError("pyarrow is needed to export the components to a Parquet file")
+                    table = pa.Table.from_pandas(df, preserve_index = False)
+                    if writer is None:
+                        writer = pq.ParquetWriter(pathname, table.schema)
+                    writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
                
     def generate_wave_x(self, x, t, **kwargs):
         """
         This method calculates the sampled waveform of the packet along the x-axis by adding 
-        up all the cosine functions with the frequencies and the aplitudes belonging to the 
-        object. 
+        up all the cosine functions with the frequencies, the aplitudes and the phases belonging 
+        to the object. 
 
         Parameters
         ----------
@@ -114,6 +454,8 @@ class w_packet:
             progress: bool
             If progress = True, a progress bar from tqdm is shown while the wave is being calculated, otherwise it's not.
             Default: True
+            stop: threading.Event
+            See generate_wave.
 
         Returns
         -------
@@ -124,27 +466,63 @@ class w_packet:
             raise AttributeError("Make sure you generated the frequencies and the amplitudes before generating the waveform")
             return 
         
-        if ('progress' not in kwargs) or (kwargs['progress'] == True):
+        return self.generate_wave(x, t, **kwargs)
+
+        
+    def generate_wave(self, x, t, **kwargs):
+        """
+        This method calculates the waveform of the packet at the points (x, t), where x and t
+        are arrays of the same size (or floats), with a single pass over the components. It 
+        is used by generate_wave_x and generate_wave_t, and to evaluate together waveforms
+        requested along different axes.
+
+        Parameters
+        ----------
+        x : array/float
+            Positions at which the wave has to be calculated.
+        t : array/float
+            Instants at which the wave has to be calculated.
+        **kwargs : 
+            progress: bool
+            If progress = True, a progress bar from tqdm is shown while the wave is being calculated, otherwise it's not.
+            Default: True
+            stop: threading.Event
+            If it is set while the wave is being calculated, the calculation is interrupted
+            and None is returned. Default: never interrupted
+
+        Returns
+        -------
+        wf : array
+            Array containing the calculated wave packet at each point (x[j], t[j]) (None if 
+            interrupted).
+        """
+        if (len(self.freqs) == 0) or (len(self.amplitudes) == 0):
+            raise AttributeError("Make sure you generated the frequencies and the amplitudes before generating the wave")
+            return 
+        self._check_sizes()
+
+        interval = range(0, len(self.freqs))
+        if kwargs.get('progress', True) == True:
             print('Generating the wave...')
-            interval = tqdm(range(0, len(self.freqs)))
-        if 'progress' in kwargs:
-            if kwargs['progress'] == False:
-                interval = range(0, len(self.freqs))
+            interval = tqdm(interval)
 
-        k = self.disp[0](self.freqs, *self.disp[1:])
+        k = self.wavenumbers()
+        x = np.asarray(x, dtype = float)
+        t = np.asarray(t, dtype = float)
 
-        wf = np.zeros(len(x))
-        
+        stop = kwargs.get('stop', None)
+        wf = np.zeros(np.broadcast(x, t).shape)
         for i in interval:
-            wf = wf + self.amplitudes[i] * np.cos(k[i] * x - 2 *  np.pi * self.freqs[i] * t)
+            if (stop is not None) and stop.is_set():
+                return None
+            wf = wf + self.amplitudes[i] * np.cos(k[i] * x - 2 *  np.pi * self.freqs[i] * t + self.phases[i])
         return wf
 
-        
     def generate_wave_t(self, t, x, **kwargs):
         """
         This method calculates the sampled waveform of the packet along the t-axis by adding 
-        up all the cosine functions with the frequencies and the aplitudes belonging to the 
-        object. 
+        up all the cosine functions with the frequencies, the aplitudes and the phases belonging 
+        to the object. 
 
         Parameters
         ----------
@@ -157,6 +535,8 @@ class w_packet:
             progress: bool
             If progress = True, a progress bar from tqdm is shown while the wave is being calculated, otherwise it's not.
             Default: True
+            stop: threading.Event
+            See generate_wave.
 
         Returns
         -------
@@ -167,20 +547,7 @@ class w_packet:
             raise AttributeError("Make sure you generated the frequencies and the amplitudes before generating the wave")
             return 
         
-        if ('progress' not in kwargs) or (kwargs['progress'] == True):
-            print('Generating the wave...')
-            interval = tqdm(range(0, len(self.freqs)))      
-        if 'progress' in kwargs:
-            if kwargs['progress'] == False:
-                interval = range(0, len(self.freqs))
-                
-        k = self.disp[0](self.freqs, *self.disp[1:])
-        
-        
-        wf = np.zeros(len(t))
-        for i in interval:
-            wf = wf + self.amplitudes[i] * np.cos(k[i] * x - 2 *  np.pi * self.freqs[i] * t)
-        return wf
+        return self.generate_wave(x, t, **kwargs)
         
         
     def wave(self, axis, **kwargs):
@@ -203,6 +570,9 @@ class w_packet:
                 Default: no ylim set
             color: string
                 Color of the plot. Default: teal
+            y: array
+                Samples of the waveform already calculated on the chosen axis. If given, the
+                waveform is not generated again.
         Returns
         -------
         y_plot : array
@@ -219,7 +589,10 @@ class w_packet:
             x_plot = kwargs['x']
             x_lab = 'x (m)'
             title = 'Wave packet at t = {} s'.format(kwargs['t'])
-            y_plot = self.generate_wave_x(x_plot, kwargs['t'])
+            if kwargs.get('y') is not None:
+                y_plot = kwargs['y']
+            else:
+                y_plot = self.generate_wave_x(x_plot, kwargs['t'])
         elif axis == 't': 
             if 't' not in kwargs:
                 raise AttributeError("Missing t axis")
@@ -230,7 +603,10 @@ class w_packet:
             x_plot = kwargs['t']
             x_lab = 't (s)'
             title = 'Wave packet at x = {} m'.format(kwargs['x'])
-            y_plot = self.generate_wave_t(x_plot, kwargs['x'])
+            if kwargs.get('y') is not None:
+                y_plot = kwargs['y']
+            else:
+                y_plot = self.generate_wave_t(x_plot, kwargs['x'])
         else:
             raise AttributeError("{} is not a valid axis".format(axis))
             return 
@@ -248,6 +624,71 @@ class w_packet:
         return y_plot
         
         
+    def animation_frames(self, d, step, xx, **kwargs):
+        """
+        This method calculates the waveforms along the x-axis at the instants of the 
+        animation of the time evolution of the packet.
+
+        Parameters
+        ----------
+        d : float
+            Duration of the animation (last instant plotted).
+        step : float
+            Time interval between the instants of two consecutive frames.
+        xx : array
+            Array containing the samples along the x-axis where the waveforms have to be
+            calculated.
+        **kwargs : 
+            progress: bool
+                If progress = True, a progress bar from tqdm is shown while the frames are
+                being calculated, otherwise it's not. Default: True
+            stop: threading.Event
+                If it is set while the frames are being calculated, the calculation is
+                interrupted and None is returned. Default: never interrupted
+            engine: string
+            - if engine = 'components' each frame is calculated by adding up all the 
+              components of the packet
+            - if engine = 'spectral' only the frame at t = 0 is calculated from the 
+              components, the others are obtained from it with the function propagate 
+              (xx must be uniformly spaced)
+            - default: 'components'
+
+        Returns
+        -------
+        frames : list/array
+            Waveform at each instant (None if interrupted).
+        """
+        num = int(d/step) + 1
+        instants = np.linspace(0, d, num)
+        stop = kwargs.get('stop', None)
+        engine = kwargs.get('engine', 'components')
+        if engine == 'spectral':
+            if self.disp is None:
+                raise AttributeError("The spectral engine needs a single dispersion relation, this packet is a sum of packets with different ones")
+                return
+            if kwargs.get('progress', True) == True:
+                print("Generating the animation...")
+            y0 = self.generate_wave_x(xx, 0, progress = False, stop = stop)
+            if y0 is None:
+                return None
+            return propagate(xx, y0, instants, self.disp)
+        elif engine != 'components':
+            raise AttributeError("{} is not a valid engine".format(engine))
+            return
+        interval = instants
+        if kwargs.get('progress', True) == True:
+            print("Generating the animation...")
+            interval = tqdm(instants)
+        frames = []
+        for tt in interval:
+            if (stop is not None) and stop.is_set():
+                return None
+            yy = self.generate_wave_x(xx, tt, progress = False, stop = stop)
+            if yy is None:
+                return None
+            frames.append(yy)
+        return frames
+
     def animate(self, d, step, xx, **kwargs):
         """
         This method generates an animation of the time evolution of the packet
@@ -266,6 +707,11 @@ class w_packet:
                 If save = True, the animation is saved, otherwise it is not.
             pathname: string
                 Pathname of the location where the animation has to be saved.
+            frames: list
+                Waveforms already calculated with animation_frames(d, step, xx). If given,
+                they are not generated again.
+            engine: string
+                'components' or 'spectral', see animation_frames. Default: 'components'
 
         Returns
         -------
@@ -276,17 +722,13 @@ class w_packet:
             if (kwargs['save'] == True) and ('pathname' not in kwargs):
                 raise AttributeError("Missing pathname")
                 return
-        num = int(d/step) + 1
-        instants = np.linspace(0, d, num)
+        frames = kwargs.get('frames')
+        if frames is None:
+            frames = self.animation_frames(d, step, xx, engine = kwargs.get('engine', 'components'))
         fig, ax = plt.subplots(figsize = (10,5))
         ims = []
-        yy = self.generate_wave_x(xx, 0, progress = False)
-        im, = ax.plot(xx, yy, animated=True, color = 'teal')
-        ims.append([im,])
-        ymax = max(np.abs(yy))
-        print("Generating the animation...")
-        for tt in tqdm(instants[1:]):
-            yy = self.generate_wave_x(xx, tt, progress = False)
+        ymax = max(np.abs(frames[0]))
+        for yy in frames:
             im, = ax.plot(xx, yy, animated=True, color = 'teal')
             ims.append([im,])
 
@@ -318,6 +760,9 @@ class w_packet:
         **kwargs : 
             plot: bool
                 If plot = True, a plot of the power spectrum is generated.
+            y: array
+                Samples of the waveform already calculated with generate_wave_t(t, x). If
+                given, the waveform is not generated again.
                 
         Returns
         -------
@@ -328,20 +773,124 @@ class w_packet:
         powers : array
             Squared modules of the samples of the Fourier transform of the packet.
         """
-        y = self.generate_wave_t(t, x, progress = False)
+        y = kwargs.get('y')
+        if y is None:
+            y = self.generate_wave_t(t, x, progress = False)
         ffts = fft.rfft(y, n = len(y))
         fftfreqs = fft.rfftfreq(len(t), d = t[1] - t[0])
         powers = np.absolute(ffts) ** 2
         if 'plot' in kwargs:
             if kwargs['plot'] == True:
-                plt.figure(figsize = (10,5))
-                plt.plot(fftfreqs, powers, color = 'crimson')
-                plt.title('Power spectrum at x = {} m'.format(x))
-                plt.xlabel('f (Hz)')
-                plt.ylabel('Power (a.u.)')
-                plt.xlim((0, 5))
-                plt.show()
+                plot_power_spectrum(fftfreqs, powers, x)
         return fftfreqs, ffts, powers
 
 
 
+def _same_disp(disp_a, disp_b):
+    return (disp_a[0] is disp_b[0]) and (list(disp_a[1:]) == list(disp_b[1:]))
+
+
+def plot_power_spectrum(fftfreqs, powers, x):
+    """
+    This function plots the power spectrum calculated by w_packet.power_spectrum.
+
+    Parameters
+    ----------
+    fftfreqs : array
+        Frequencies of the DFT of the packet.
+    powers : array
+        Squared modules of the samples of the Fourier transform of the packet.
+    x : float
+        Fixed position where the packet is calculated.
+
+    Returns
+    -------
+    None.
+    """
+    plt.figure(figsize = (10,5))
+    plt.plot(fftfreqs, powers, color = 'crimson')
+    plt.title('Power spectrum at x = {} m'.format(x))
+    plt.xlabel('f (Hz)')
+    plt.ylabel('Power (a.u.)')
+    plt.xlim((0, 5))
+    plt.show()
+
+
+def propagate(x, y0, times, disp):
+    """
+    This function calculates the time evolution of a waveform sampled along the x-axis 
+    without knowing its components. The DFT of the samples is calculated only once with 
+    scipy.fft.rfft; for each wave number k of the DFT the frequency f(k) is obtained by 
+    inverting the dispersion relation, and the waveform at the instant t is the inverse DFT 
+    of the coefficients multiplied by exp(-i*2*pi*f(k)*t). Each instant costs O(M log M), 
+    with M = len(x), whatever the number of components of the packet.
+    The waveform is assumed to travel towards increasing x and, like every DFT, to be 
+    periodic with period len(x)*(x[1] - x[0]): the x-axis must be wide enough to contain 
+    the packet at all the requested instants.
+
+    Parameters
+    ----------
+    x : array
+        Uniformly spaced samples along the x-axis.
+    y0 : array
+        Waveform sampled at x at the instant t = 0.
+    times : array/float
+        Instants at which the waveform has to be calculated.
+    disp : list/function
+        Dispersion relation k(f) and its optional arguments, in the same form as the
+        attribute disp of w_packet (or only the function, if it has no arguments). k(f) 
+        must not decrease with f for f >= 0 (this is checked on a grid of frequencies, 
+        otherwise an error is raised); wave numbers below k(0) are given f = 0.
+
+    Returns
+    -------
+    wf : array
+        Array with shape (len(times), len(x)) containing the waveform at each instant
+        (array with shape (len(x),) if times is a float).
+    """
+    x = np.asarray(x, dtype = float)
+    y0 = np.asarray(y0, dtype = float)
+    if len(x) != len(y0):
+        raise AttributeError("Make sure that the arrays of the positions and of the waveform have the same sizes")
+        return
+    if len(x) < 2:
+        raise AttributeError("At least two samples are needed to propagate the waveform")
+        return
+    dx = x[1] - x[0]
+    if not np.allclose(np.diff(x), dx, rtol = 1e-6, atol = 0):
+        raise AttributeError("Make sure that the samples along the x-axis are uniformly spaced")
+        return
+    if callable(disp):
+        disp = [disp]
+    k_disp = lambda f: disp[0](f, *disp[1:])
+
+    coeffs = fft.rfft(y0)
+    k = 2 * np.pi * fft.rfftfreq(len(x), d = dx)
+
+    #inverting k(f) by bisection, all the wave numbers at once
+    f_lo = np.zeros(len(k))
+    f_hi = np.ones(len(k))
+    for i in range(1000):
+        if k_disp(f_hi[0]) >= k[-1]:
+            break
+        f_hi = 2 * f_hi
+    if not (k_disp(f_hi[0]) >= k[-1]):
+        raise AttributeError("The dispersion relation does not reach the highest wave number of the samples")
+        return
+    #the bisection is valid only if k(f) does not decrease on [0, f_hi]
+    f_check = np.unique(np.concatenate((np.linspace(0, f_hi[0], 4097), np.geomspace(f_hi[0] * 1e-12, f_hi[0], 4097))))
+    k_check = k_disp(f_check)
+    if (not np.all(np.isfinite(k_check))) or np.any(np.diff(k_check) < 0):
+        raise AttributeError("The dispersion relation k(f) must not decrease with f to propagate the waveform")
+        return
+    for i in range(100):
+        f_mid = (f_lo + f_hi) / 2
+        below = k_disp(f_mid) < k
+        f_lo = np.where(below, f_mid, f_lo)
+        f_hi = np.where(below, f_hi, f_mid)
+    omega = np.pi * (f_lo + f_hi)
+
+    tt = np.asarray(times, dtype = float)
+    phases = np.exp(-1j * np.multiply.outer(tt, omega))
+    wf = fft.irfft(coeffs * phases, n = len(x), axis = -1)
+    return wf
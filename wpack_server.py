@@ -0,0 +1,464 @@
+import numpy as np
+import os
+import stat
+import time
+import pickle
+import struct
+import socket
+import socketserver
+import threading
+import hashlib
+import argparse
+import collections
+import concurrent.futures
+
+from wpack import w_packet, plot_power_spectrum
+
+
+# Messages are pickled objects preceded by their length (8 bytes, big endian).
+# Pickle can run arbitrary code when loaded: the socket is created readable and writable
+# only by its owner, and only trusted processes must be allowed to connect to it.
+
+def send_msg(sock, obj):
+    data = pickle.dumps(obj, protocol = pickle.HIGHEST_PROTOCOL)
+    sock.sendall(struct.pack('!Q', len(data)) + data)
+
+def recv_msg(sock):
+    header = _recv_exactly(sock, 8)
+    if header is None:
+        return None
+    data = _recv_exactly(sock, struct.unpack('!Q', header)[0])
+    if data is None:
+        raise ConnectionError("Connection closed in the middle of a message")
+    return pickle.loads(data)
+
+def _recv_exactly(sock, n):
+    chunks = []
+    while n > 0:
+        chunk = sock.recv(min(n, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b''.join(chunks)
+
+
+def _array_key(a):
+    """
+    Hashable key of an array (or float), used for the result cache.
+    """
+    a = np.ascontiguousarray(a, dtype = float)
+    return (a.shape, hashlib.sha1(a.tobytes()).hexdigest())
+
+
+class packet_service:
+    """
+    Class holding the loaded packets and evaluating their waveforms and spectra. The
+    requests on the same packet that arrive while an evaluation is being prepared are
+    merged into a single batched evaluation (one pass over the components for all of
+    them), and the results are kept in a cache shared by all the clients.
+
+    ...
+
+    Attributes
+    ----------
+    packets : dict
+        Loaded packets, name: (version, w_packet).
+    window : float
+        Time (s) during which the requests on a packet are collected before evaluating them.
+    cache_size : int
+        Maximum number of results kept in the cache.
+    stats : collections.Counter
+        Number of cache hits, merged and evaluated requests, batches and batches whose
+        requests were evaluated one by one after an error.
+
+    Methods
+    -------
+    load(name, packet)
+    unload(name)
+    list_packets()
+    evaluate(name, method, *args)
+    cache_info()
+    """
+    def __init__(self, window = 0.005, cache_size = 256):
+        self.packets = {}
+        self.window = window
+        self.cache_size = cache_size
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+        self._cache = collections.OrderedDict() #key: result, in order of last use
+        self._inflight = {} #key: future of a request being evaluated
+        self._pending = collections.defaultdict(list) #name: [(key, method, args, future)]
+        self._running = set() #names of the packets whose batch is being collected or evaluated
+        self._versions = 0
+
+    def load(self, name, packet):
+        """
+        This method loads (or replaces) the packet with the given name. The cached results
+        of a replaced packet are removed.
+        """
+        if not isinstance(packet, w_packet):
+            raise AttributeError("Only w_packet objects can be loaded")
+        with self._lock:
+            self._versions += 1
+            self.packets[name] = (self._versions, packet)
+            #the results of the replaced packet can not be requested anymore
+            for key in [key for key in self._cache if key[0] == name]:
+                del self._cache[key]
+        return len(packet.freqs)
+
+    def unload(self, name):
+        """
+        This method removes the packet with the given name and its cached results.
+        """
+        with self._lock:
+            if name not in self.packets:
+                raise KeyError("There is no packet named {}".format(name))
+            del self.packets[name]
+            for key in [key for key in self._cache if key[0] == name]:
+                del self._cache[key]
+
+    def list_packets(self):
+        """
+        This method returns the names of the loaded packets and their numbers of components.
+        """
+        with self._lock:
+            return {name: len(packet.freqs) for name, (version, packet) in self.packets.items()}
+
+    def cache_info(self):
+        """
+        This method returns the statistics of the service and the size of the cache.
+        """
+        with self._lock:
+            info = dict(self.stats)
+            info['cached'] = len(self._cache)
+        return info
+
+    def evaluate(self, name, method, *args):
+        """
+        This method returns the result of packet.method(*args) for the packet with the given
+        name, where method is 'generate_wave_x' (args: x, t), 'generate_wave_t' (args: t, x)
+        or 'power_spectrum' (args: t, x). The result is taken from the cache, shared with an
+        identical request being evaluated, or evaluated by a worker thread in a batch with
+        the other pending requests on the same packet.
+        """
+        args = _check_request(method, args)
+        with self._lock:
+            if name not in self.packets:
+                raise KeyError("There is no packet named {}".format(name))
+            version = self.packets[name][0]
+            key = (name, version, method, _array_key(args[0]), _array_key(args[1]))
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.stats['hits'] += 1
+                return self._cache[key]
+            future = self._inflight.get(key)
+            if future is not None:
+                self.stats['merged'] += 1
+            else:
+                future = concurrent.futures.Future()
+                self._inflight[key] = future
+                self._pending[name].append((key, method, args, future))
+                if name not in self._running:
+                    #a worker thread collects the batches of this packet until none is pending
+                    self._running.add(name)
+                    threading.Thread(target = self._run_batches, args = (name,), daemon = True).start()
+        return future.result()
+
+    def _run_batches(self, name):
+        time.sleep(self.window)
+        while True:
+            with self._lock:
+                batch = self._pending.pop(name, [])
+                if len(batch) == 0:
+                    self._running.discard(name)
+                    return
+                entry = self.packets.get(name)
+            if entry is None:
+                exc = KeyError("There is no packet named {}".format(name))
+                outcomes = [(False, exc) for request in batch]
+            else:
+                try:
+                    outcomes = [(True, result) for result in self._evaluate_batch(entry[1], batch)]
+                except Exception:
+                    #each request is evaluated alone, so that only the failing ones get the error
+                    outcomes = []
+                    for request in batch:
+                        try:
+                            outcomes.append((True, self._evaluate_batch(entry[1], [request])[0]))
+                        except Exception as exc:
+                            outcomes.append((False, exc))
+                    self.stats['retried'] += 1
+            with self._lock:
+                self.stats['batches'] += 1
+                self.stats['evaluated'] += len(batch)
+                for (key, method, args, future), (ok, result) in zip(batch, outcomes):
+                    self._inflight.pop(key, None)
+                    if ok and (name in self.packets) and (self.packets[name][0] == key[1]):
+                        self._cache[key] = result
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last = False)
+            for (key, method, args, future), (ok, result) in zip(batch, outcomes):
+                if ok:
+                    future.set_result(result)
+                else:
+                    future.set_exception(result)
+
+    def _evaluate_batch(self, packet, batch):
+        """
+        This method evaluates all the requests of a batch with a single call of
+        packet.generate_wave on the concatenated points (x, t) of all of them.
+        """
+        xs, ts = [], []
+        for key, method, args, future in batch:
+            if method == 'generate_wave_x':
+                xs.append(args[0])
+                ts.append(np.full(len(args[0]), args[1]))
+            else:
+                xs.append(np.full(len(args[0]), args[1]))
+                ts.append(args[0])
+        sizes = np.cumsum([len(x) for x in xs])[:-1]
+        y = packet.generate_wave(np.concatenate(xs), np.concatenate(ts), progress = False)
+        results = []
+        for (key, method, args, future), y_r in zip(batch, np.split(y, sizes)):
+            if method == 'power_spectrum':
+                results.append(packet.power_spectrum(args[0], args[1], y = y_r))
+            else:
+                results.append(y_r)
+        return results
+
+
+def _check_request(method, args):
+    """
+    This function checks the arguments of a request before it is merged with the others:
+    an array of samples (at least 2 for power_spectrum) and a finite float. It returns
+    them as (array, float).
+    """
+    if method not in ('generate_wave_x', 'generate_wave_t', 'power_spectrum'):
+        raise AttributeError("{} is not a valid method".format(method))
+    if len(args) != 2:
+        raise AttributeError("{} needs 2 arguments, {} were given".format(method, len(args)))
+    samples = np.asarray(args[0], dtype = float)
+    if (samples.ndim != 1) or (len(samples) == 0):
+        raise AttributeError("The samples must be a non empty 1-dimensional array")
+    if (method == 'power_spectrum') and (len(samples) < 2):
+        raise AttributeError("At least 2 time samples are needed to calculate the power spectrum")
+    if np.ndim(args[1]) != 0:
+        raise AttributeError("The fixed {} must be a float".format('instant' if method == 'generate_wave_x' else 'position'))
+    fixed = float(args[1])
+    if not (np.all(np.isfinite(samples)) and np.isfinite(fixed)):
+        raise AttributeError("The arguments must be finite")
+    return samples, fixed
+
+
+def _remove_socket(path):
+    """
+    This function removes the socket left at path by a previous server. Any other kind
+    of file is left untouched and an AttributeError is raised.
+    """
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise AttributeError("The path " + str(path) + " exists and it is not a socket")
+        return
+    os.unlink(path)
+
+
+class _request_handler(socketserver.BaseRequestHandler):
+    """
+    Handler of a client connection: the requests (method, args) are answered in order
+    with ('ok', result) or ('error', exception) until the client disconnects.
+    """
+    def handle(self):
+        service = self.server.service
+        while True:
+            try:
+                request = recv_msg(self.request)
+            except (ConnectionError, OSError):
+                return
+            if request is None:
+                return
+            try:
+                method, args = request
+                if method == 'load':
+                    result = service.load(*args)
+                elif method == 'unload':
+                    result = service.unload(*args)
+                elif method == 'list':
+                    result = service.list_packets()
+                elif method == 'cache_info':
+                    result = service.cache_info()
+                elif method == 'shutdown':
+                    result = None
+                    threading.Thread(target = self.server.shutdown).start()
+                else:
+                    result = service.evaluate(args[0], method, *args[1:])
+                response = ('ok', result)
+            except Exception as exc:
+                response = ('error', exc)
+            try:
+                send_msg(self.request, response)
+            except (ConnectionError, OSError):
+                return
+
+
+class packet_server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Server answering the requests of the clients on a Unix domain socket, one thread per
+    connection, with a packet_service shared by all of them.
+    """
+    daemon_threads = True
+
+    def __init__(self, path, service):
+        _remove_socket(path)
+        self.service = service
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(path, _request_handler)
+        finally:
+            os.umask(old_umask)
+
+    def server_close(self):
+        super().server_close()
+        _remove_socket(self.server_address)
+
+
+class packet_client:
+    """
+    Client of a packet_server. The packets loaded in the server are used through
+    remote_packet objects, whose methods mirror the ones of w_packet.
+
+    ...
+
+    Methods
+    -------
+    load(name, packet)
+    unload(name)
+    packet(name)
+    list_packets()
+    cache_info()
+    shutdown()
+    close()
+    """
+    def __init__(self, path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self._lock = threading.Lock()
+
+    def _call(self, method, *args):
+        with self._lock:
+            send_msg(self.sock, (method, args))
+            response = recv_msg(self.sock)
+        if response is None:
+            raise ConnectionError("The server closed the connection")
+        status, result = response
+        if status == 'error':
+            raise result
+        return result
+
+    def load(self, name, packet):
+        """
+        This method sends the packet to the server, which keeps it under the given name. The
+        dispersion relation of the packet must be a function defined at module level in a
+        module that the server can import (the packet is pickled).
+        """
+        self._call('load', name, packet)
+        return remote_packet(self, name)
+
+    def unload(self, name):
+        self._call('unload', name)
+
+    def packet(self, name):
+        return remote_packet(self, name)
+
+    def list_packets(self):
+        return self._call('list')
+
+    def cache_info(self):
+        return self._call('cache_info')
+
+    def shutdown(self):
+        self._call('shutdown')
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class remote_packet:
+    """
+    Packet loaded in a packet_server. The waveforms and the spectra are calculated by the
+    server, with the same arguments and results of the methods of w_packet.
+
+    ...
+
+    Methods
+    -------
+    generate_wave_x(x, t, **kwargs)
+    generate_wave_t(t, x, **kwargs)
+    power_spectrum(t, x, **kwargs)
+    """
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def generate_wave_x(self, x, t, **kwargs):
+        """
+        See w_packet.generate_wave_x (the option progress is ignored).
+        """
+        return self.client._call('generate_wave_x', self.name, np.asarray(x, dtype = float), float(t))
+
+    def generate_wave_t(self, t, x, **kwargs):
+        """
+        See w_packet.generate_wave_t (the option progress is ignored).
+        """
+        return self.client._call('generate_wave_t', self.name, np.asarray(t, dtype = float), float(x))
+
+    def power_spectrum(self, t, x, **kwargs):
+        """
+        See w_packet.power_spectrum. The plot, if requested, is made by the client.
+        """
+        fftfreqs, ffts, powers = self.client._call('power_spectrum', self.name, np.asarray(t, dtype = float), float(x))
+        if kwargs.get('plot', False) == True:
+            plot_power_spectrum(fftfreqs, powers, x)
+        return fftfreqs, ffts, powers
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+    description="Local server evaluating waveforms and spectra of wave packets",
+    formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('-s', '--socket', action='store', default='wpack.sock', help=(
+    "Path of the Unix domain socket (default: wpack.sock)"))
+    parser.add_argument('-w', '--window', action='store', type=float, default=0.005, help=(
+    "Time (s) during which the requests on a packet are collected in a batch (default: 0.005)"))
+    parser.add_argument('-c', '--cache', action='store', type=int, default=256, help=(
+    "Maximum number of results in the cache (default: 256)"))
+    parser.add_argument('packets', nargs='*', help=(
+    "Packets to load at start, as name=path of a pickled w_packet"))
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    service = packet_service(window = args.window, cache_size = args.cache)
+    for item in args.packets:
+        name, path = item.split('=', 1)
+        with open(path, 'rb') as file:
+            service.load(name, pickle.load(file))
+    server = packet_server(args.socket, service)
+    print('Serving on {}'.format(args.socket))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
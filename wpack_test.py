@@ -8,6 +8,12 @@ import matplotlib.animation as animation
 from tqdm import tqdm
 import types
 import argparse
+import os
+import json
+import time
+import itertools
+import concurrent.futures
+import threading
 
 
 
@@ -211,218 +217,289 @@ def parse_arguments():
     description="Choosing freq/ampl distributions and dispersion relations",
     formatter_class=argparse.RawTextHelpFormatter
     )
-    parser.add_argument('-fd', '--freq_dist', action='store', type=int, default=1, help=(
+    parser.add_argument('-fd', '--freq_dist', action='store', type=int, nargs='+', default=None, help=(
     "Frequency distribution. Choose from the following:\n"
     "1) p(f) = f/3 for f in [0, 2], 2/3(3-f) for f in (2, 3] (default)\n"
     "2) p(f) = 2/9 f for f in [0, 3]\n"
+    "In batch mode more than one value can be given."
     ))
-    parser.add_argument('-ad', '--ampl_dist', action='store', type=int,  default=1, help=(
+    parser.add_argument('-ad', '--ampl_dist', action='store', type=int, nargs='+', default=None, help=(
     "Amplityde distribution. Choose from the following:\n"
     "1) p_f(A) = A for A in [0, a*sqrt(f)] (default)\n"
-    "2) p_f(A) = (1+f)^3 A^2 for A in [0, 1/(1+f)]"))
-    parser.add_argument('-dr', '--disp_rel', action='store', type=int,  default=2, help=(
+    "2) p_f(A) = (1+f)^3 A^2 for A in [0, 1/(1+f)]\n"
+    "In batch mode more than one value can be given."))
+    parser.add_argument('-dr', '--disp_rel', action='store', type=int, nargs='+', default=None, help=(
     "Dispersion relation. Choose from the following:\n"
     "1) w = sqrt(ck)\n"
     "2) w = sqrt(ck^2) (default)\n"
     "3) w = sqrt(ck^3)\n"
-    "4) w = sqrt(b+ck^2)"))
+    "4) w = sqrt(b+ck^2)\n"
+    "In batch mode more than one value can be given."))
+    parser.add_argument('-b', '--batch', action='store_true', help=(
+    "Non-interactive mode: every combination of the chosen distributions, dispersion\n"
+    "relations and numbers of components is run in a process pool, and waveforms,\n"
+    "spectra, figures and a summary of the timings are saved in the output directory."))
+    parser.add_argument('-c', '--config', action='store', default=None, help=(
+    "Batch mode: JSON file with the options of the batch (the keys are the long names\n"
+    "of the command line options, e.g. {\"disp_rel\": [1, 2], \"n_comp\": [1000]}).\n"
+    "Options given on the command line override the ones in the file."))
+    parser.add_argument('-n', '--n_comp', action='store', type=int, nargs='+', default=None, help=(
+    "Batch mode: number(s) of frequencies and amplitudes to generate (default: 1000)"))
+    parser.add_argument('-o', '--outdir', action='store', default=None, help=(
+    "Batch mode: output directory (default: wpack_batch)"))
+    parser.add_argument('-w', '--workers', action='store', type=int, default=None, help=(
+    "Batch mode: number of worker processes (default: number of CPUs)"))
+    parser.add_argument('--seed', action='store', type=int, default=None, help=(
+    "Batch mode: seed from which the seeds of the configurations are derived, each\n"
+    "configuration gets a different one (default: random). The seed used by each\n"
+    "configuration is written in the summary."))
+    parser.add_argument('--bins', action='store', type=int, default=None, help=(
+    "Batch mode: number of bins of the histograms, 0 to skip them (default: 30)"))
+    parser.add_argument('--order', action='store', default=None, help=(
+    "Batch mode: order of the exported table of the components, 'freq' or 'ampl',\n"
+    "'none' to skip it (default: none)"))
+    parser.add_argument('--animate', action='store_true', default=None, help=(
+    "Batch mode: save the animation of the time evolution of each packet"))
+    parser.add_argument('-p', '--prefetch', action='store_true', help=(
+    "Interactive mode: while the questions are being answered, the animation frames and\n"
+    "the waveforms of the power spectra are calculated in the background"))
+    parser.add_argument('--no_spectra', dest='spectra', action='store_false', default=None, help=(
+    "Batch mode: skip the power spectra"))
     return  parser.parse_args()
 
 
+# Generating the packets
+
+def generate_components(fd, ad, n_comp):
+    """
+    This function generates the frequencies and the amplitudes of a packet, together with
+    the frequency probability distribution sampled for the histogram.
+
+    Parameters
+    ----------
+    fd : int
+        Frequency distribution (see parse_arguments).
+    ad : int
+        Amplitude distribution (see parse_arguments).
+    n_comp : int
+        Number of frequencies and amplitudes to be generated.
+
+    Returns
+    -------
+    freq : array
+        Generated frequencies.
+    ampl : array
+        Generated amplitudes.
+    x_freq_dist : array
+        Frequencies at which the probability distribution is sampled.
+    freq_dist : array
+        Sampled probability distribution of the frequencies.
+
+    """
+    if fd == 1:
+        freq = dist_f_1(n_comp)
+        x_freq_dist = np.arange(0, 3, 0.1)
+        mask_xf_1 = x_freq_dist <= 2
+        mask_xf_2 = x_freq_dist > 2
+        freq_dist = np.zeros(len(x_freq_dist))
+        freq_dist[mask_xf_1] = x_freq_dist[mask_xf_1]/3
+        freq_dist[mask_xf_2] = 2/3 * (3 - x_freq_dist[mask_xf_2])
+    elif fd == 2:
+        freq = dist_f_2(n_comp)
+        x_freq_dist = np.arange(0, 3, 0.1)
+        freq_dist = 2/9 * x_freq_dist
+    else:
+        raise ValueError("'{}' is not a valid frequency distribution".format(fd))
+
+    if ad == 1:
+        ampl = dist_A_1(n_comp, freq, 1)
+    elif ad == 2:
+        ampl = dist_A_2(n_comp, freq)
+    else:
+        raise ValueError("'{}' is not a valid amplitude distribution".format(ad))
+    return freq, ampl, x_freq_dist, freq_dist
 
 
+def create_packet(dr, freq, ampl):
+    """
+    This function creates the packet with the chosen dispersion relation, together with the
+    x-axes on which it is plotted and the position of the second power spectrum.
+
+    Parameters
+    ----------
+    dr : int
+        Dispersion relation (see parse_arguments).
+    freq : array
+        Frequencies of the packet.
+    ampl : array
+        Amplitudes of the packet.
 
+    Returns
+    -------
+    packet : w_packet
+        Created packet.
+    x_0 : array
+        Positions at which the packet is plotted at t = 0.
+    x_evo : array
+        Positions at which the time evolution of the packet is animated.
+    x_f : float
+        Position of the second power spectrum.
+
+    """
+    if dr == 1:
+        packet = w_packet(freq, ampl, disp_1, c = 9e16)
+        x_0 = np.arange(-1.5, 1.5, 0.005)*1e16
+        x_evo = np.arange(-0.5, 2, 0.005)*1e17 #per durata animazione = 20 s
+        #x_f = 1000000000
+        #x_f = 10000000000000
+        x_f = 1e16
+        
+    elif dr == 2:
+        packet = w_packet(freq, ampl, disp_2, c = 9e16)
+        x_0 = np.arange(-1, 1, 0.005)*1e9
+        x_evo = np.arange(-1, 7, 0.005)*1e9 #per durata animazione = 20 s
+        x_f = 1e9
+
+    elif dr == 3:
+        packet = w_packet(freq, ampl, disp_3, c = 9e16)
+        x_0 = np.arange(-7, 7, 0.005)*1e6
+        x_evo = np.arange(-3, 38, 0.005)*1e6 #per durata animazione = 20 s
+        x_f = 1e6
+        
+    elif dr == 4:
+        packet = w_packet(freq, ampl, disp_4, b = -1000, c = 9e16)
+        x_0 = np.arange(-2, 2, 0.005)*1e9
+        x_evo = np.arange(-2, 40, 0.005)*1e9 #per durata animazione = 20 s
+        x_f = 1e9
 
-args = parse_arguments()
-args = np.array([arg for arg in args.__dict__.values()])
-
-
-# Generating the frequencies 
-n_comp = input('How many frequencies and amplitudes do you want to generate? ')
-
-if args[0] == 1:
-    freq = dist_f_1(int(n_comp))
-    x_freq_dist = np.arange(0, 3, 0.1)
-    mask_xf_1 = x_freq_dist <= 2
-    mask_xf_2 = x_freq_dist > 2
-    freq_dist = np.zeros(len(x_freq_dist))
-    freq_dist[mask_xf_1] = x_freq_dist[mask_xf_1]/3
-    freq_dist[mask_xf_2] = 2/3 * (3 - x_freq_dist[mask_xf_2])
-    
-elif args[0] == 2:
-    freq = dist_f_2(int(n_comp))
-    func = dist_f_1
-    x_freq_dist = np.arange(0, 3, 0.1)
-    freq_dist = 2/9 * x_freq_dist
-
-f_hist = input('Do you want to see the frequencies distribution histogram? [y/n] ')
-if (f_hist != 'y') and (f_hist != 'n'):
-    raise ValueError("'{}' is not a valid answer".format(f_hist))
-if f_hist == 'y':
-    bins = input('Please insert the number of bins you want to display: ')
-    plt.figure(figsize = (10,5))
-    plt.hist(freq, bins = int(bins), color = 'crimson', density = True, label = 'f dist.')
-    plt.plot(x_freq_dist, freq_dist, color = 'teal', label = 'f. prob. dist.')
-    plt.xlabel('f (Hz)')
-    plt.ylabel('p(f)')
-    plt.title('Frequencies distribution histogram (normalized)')
-    plt.legend()
-    plt.show()
-    
-# Generating the amplitudes
-if args[1] == 1:
-    ampl = dist_A_1(int(n_comp), freq, 1)
-
-elif args[1] == 2:
-    ampl = dist_A_2(int(n_comp), freq)
-
-A_hist = input('Do you want to see the amplitudes distribution histogram? [y/n] ')
-if (A_hist != 'y') and (A_hist != 'n'):
-    raise ValueError("'{}' is not a valid answer".format(A_hist), density = True)
-if A_hist == 'y':
-    bins = input('Please insert the number of bins you want to display: ')
-    plt.figure(figsize = (10,5))
-    plt.hist(ampl, bins = int(bins), color = 'crimson')
-    plt.xlabel('A (a. u.)')
-    plt.ylabel('N. occurrencies')
-    plt.title('Amplitudes distribution histogram')
-    plt.show()
-
-
-f_hist_w = input('Do you want to see the weighed frequencies distribution histogram? [y/n] ')
-if (f_hist_w != 'y') and (f_hist_w != 'n'):
-    raise ValueError("'{}' is not a valid answer".format(f_hist_w))
-if f_hist_w == 'y':
-    bins = input('Please insert the number of bins you want to display: ')
-    plt.figure(figsize = (10,5))
-    plt.hist(freq, bins = int(bins), weights = ampl, color = 'crimson')
-    plt.xlabel('f (Hz)')
-    plt.ylabel('N. occurrencies')
-    plt.title('Frequencies distribution histogram')
-    plt.show()
-    
-
-
-# Creating the packet
-
-
-if args[2] == 1:
-    packet = w_packet(freq, ampl, disp_1, c = 9e16)
-    x_0 = np.arange(-1.5, 1.5, 0.005)*1e16
-    x_evo = np.arange(-0.5, 2, 0.005)*1e17 #per durata animazione = 20 s
-    #x_f = 1000000000
-    #x_f = 10000000000000
-    x_f = 1e16
-    
-elif args[2] == 2:
-    packet = w_packet(freq, ampl, disp_2, c = 9e16)
-    x_0 = np.arange(-1, 1, 0.005)*1e9
-    x_evo = np.arange(-1, 7, 0.005)*1e9 #per durata animazione = 20 s
-    x_f = 1e9
-
-elif args[2] == 3:
-    packet = w_packet(freq, ampl, disp_3, c = 9e16)
-    x_0 = np.arange(-7, 7, 0.005)*1e6
-    x_evo = np.arange(-3, 38, 0.005)*1e6 #per durata animazione = 20 s
-    x_f = 1e6
-    
-elif args[2] == 4:
-    packet = w_packet(freq, ampl, disp_4, b = -1000, c = 9e16)
-    x_0 = np.arange(-2, 2, 0.005)*1e9
-    x_evo = np.arange(-2, 40, 0.005)*1e9 #per durata animazione = 20 s
-    x_f = 1e9
-    
-
-t = np.arange(-5, 5, 1/60)
-
-
-    
-    
-# Plotting the packet along x-axis at t=0
-
-
-packet.wave(axis = 'x', x = x_0, t=0)
-
-
-# Displaying the components
-
-comp = input('Do you want to print a dataframe of the freq. and amplitudes of the package? [y/n] ')
-if (comp != 'y') and (comp != 'n'):
-    raise ValueError("'{}' is not a valid answer".format(comp))
-elif comp == 'y':
-    order_df = input('Do you want them to be printed in the order of increasing frequencies [1] or decreasing amplitudes [2]? ')
-    if (order_df != '1') and (order_df != '2'):
-        raise ValueError("'{}' is not a valid answer".format(order_df))
-    elif order_df == '1':
-        order = 'freq'
     else:
-        order = 'ampl'
-    packet.display_components_df(order = order)
-    
-# Animating the time evolution of the packet
-
-anim = input('Do you want to see the animation of the time evolution of the packet? [y/n] ')
-
-if (anim != 'y') and (anim != 'n'):
-    raise ValueError("'{}' is not a valid answer".format(anim))
-elif anim == 'y':
-    sv = False
-    path = ''
-    save = input('Do you want to save the animation? [y/n] ')
-    if (save != 'y') and (save != 'n'):
-        raise ValueError("'{}' is not a valid answer".format(save))
-    elif save == 'y':
-        sv = True
-        path = input('Insert the pathname of the file you want to save. Please include the file name and the extension (.gif): ')
-
-    packet.animate(20, 0.1, x_evo, save = sv, pathname = path)
-
-
-# Plotting the Fourier power spectrum
-
-
-spectrum = input('Do you want to see the Fourier power spectrum of the packet at x=0? [y/n] ')
-if (spectrum != 'y') and (spectrum != 'n'):
-    raise ValueError("'{}' is not a valid answer".format(spectrum))
-elif spectrum == 'y':
-    packet.wave(axis = 't', t = t, x=0)
-    fftfreqs_0, ffts_0, powers_0 = packet.power_spectrum(t, 0, plot = True)
-    
-    #Plotting the real part 
-    
-    plt.figure(figsize = (10,5))
-    plt.plot(fftfreqs_0, 2*abs(ffts_0.real)/len(t), color = 'crimson', label = 'Real part spectrum')
-    plt.title('Real part spectrum at x = {} m'.format(0))
-    plt.hist(freq, bins = 30, weights = ampl, color = 'teal', label = 'f dist. weighed hist.')
-    plt.xlabel('f (Hz)')
-    plt.ylabel('Real part (a.u.)')
-    plt.xlim((0, 3))
-    plt.legend()
-    plt.show()
-
-
-
-spectrum_x = input('Do you want to see the Fourier power spectrum of the packet at another position? [y/n] ')
-if (spectrum_x != 'y') and (spectrum_x != 'n'):
-    raise ValueError("'{}' is not a valid answer".format(spectrum_x))
-elif spectrum_x == 'y':
-    packet.wave(axis = 't', t = t, x=x_f)
-    fftfreqs_x, ffts_x, powers_x = packet.power_spectrum(t, x_f, plot = True)
-    
-    
-  
-    comparison = input('Do you want to compare the power spectra at the two positions? [y/n] ')
-    if (comparison != 'y') and (comparison != 'n'):
-        raise ValueError("'{}' is not a valid answer".format(comparison))
-    elif comparison == 'y':
-    
-        t = np.arange(-5, 15, 1/60) 
-    
+        raise ValueError("'{}' is not a valid dispersion relation".format(dr))
+    return packet, x_0, x_evo, x_f
+
+
+# Batch mode
+
+DEFAULTS = {'freq_dist': [1], 'ampl_dist': [1], 'disp_rel': [2], 'n_comp': [1000],
+                  'outdir': 'wpack_batch', 'workers': None, 'seed': None, 'bins': 30,
+                  'order': 'none', 'animate': False, 'spectra': True}
+
+
+def batch_options(args):
+    """
+    This function merges the defaults of the batch mode, the options in the config file
+    and the ones given on the command line (in increasing order of priority).
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Parsed command line arguments.
+
+    Returns
+    -------
+    options : dict
+        Options of the batch.
+
+    """
+    options = dict(DEFAULTS)
+    if args.config is not None:
+        with open(args.config) as file:
+            config = json.load(file)
+        for key, value in config.items():
+            if key not in DEFAULTS:
+                raise ValueError("'{}' is not a valid option of the config file".format(key))
+            options[key] = value
+    for key in DEFAULTS:
+        if getattr(args, key) is not None:
+            options[key] = getattr(args, key)
+    for key in ('freq_dist', 'ampl_dist', 'disp_rel', 'n_comp'):
+        if np.isscalar(options[key]):
+            options[key] = [options[key]]
+    if options['order'] not in ('freq', 'ampl', 'none'):
+        raise ValueError("'{}' is not a valid order".format(options['order']))
+    return options
+
+
+def run_configuration(config):
+    """
+    This function runs a single configuration of the batch without any interaction: it 
+    creates the packet, then saves its waveform, power spectra, figures and (optionally) 
+    the table of its components and its animation in config['outdir'].
+
+    Parameters
+    ----------
+    config : dict
+        Configuration: 'name', 'outdir', 'freq_dist', 'ampl_dist', 'disp_rel', 'n_comp',
+        'seed', 'bins', 'order', 'animate', 'spectra'.
+
+    Returns
+    -------
+    timings : dict
+        The configuration, with the time in seconds spent in each step and in total.
+
+    """
+    plt.switch_backend('Agg')
+    timings = dict(config)
+    path = os.path.join(config['outdir'], config['name'])
+    start = time.perf_counter()
+    np.random.seed(config['seed'])
+
+    t0 = time.perf_counter()
+    freq, ampl, x_freq_dist, freq_dist = generate_components(config['freq_dist'], config['ampl_dist'], config['n_comp'])
+    packet, x_0, x_evo, x_f = create_packet(config['disp_rel'], freq, ampl)
+    timings['t_packet'] = time.perf_counter() - t0
+
+    if config['bins'] > 0:
+        t0 = time.perf_counter()
+        fig, ax = plt.subplots(1, 3, figsize = (18,5))
+        ax[0].hist(freq, bins = config['bins'], color = 'crimson', density = True, label = 'f dist.')
+        ax[0].plot(x_freq_dist, freq_dist, color = 'teal', label = 'f. prob. dist.')
+        ax[0].set_xlabel('f (Hz)')
+        ax[0].set_ylabel('p(f)')
+        ax[0].set_title('Frequencies distribution histogram (normalized)')
+        ax[0].legend()
+        ax[1].hist(ampl, bins = config['bins'], color = 'crimson')
+        ax[1].set_xlabel('A (a. u.)')
+        ax[1].set_ylabel('N. occurrencies')
+        ax[1].set_title('Amplitudes distribution histogram')
+        ax[2].hist(freq, bins = config['bins'], weights = ampl, color = 'crimson')
+        ax[2].set_xlabel('f (Hz)')
+        ax[2].set_ylabel('N. occurrencies')
+        ax[2].set_title('Frequencies distribution histogram')
+        fig.savefig(path + '_histograms.png')
+        plt.close(fig)
+        timings['t_histograms'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    y_0 = packet.generate_wave_x(x_0, 0, progress = False)
+    np.savez(path + '_wave_x.npz', x = x_0, t = 0, y = y_0)
+    fig = plt.figure(figsize = (10,5))
+    plt.plot(x_0, y_0, color = 'teal')
+    plt.xlabel('x (m)')
+    plt.ylabel('Amplitude (a.u.)')
+    plt.title('Wave packet at t = 0 s')
+    fig.savefig(path + '_wave_x.png')
+    plt.close(fig)
+    timings['t_wave_x'] = time.perf_counter() - t0
+
+    if config['order'] != 'none':
+        t0 = time.perf_counter()
+        packet.export_components(path + '_components.csv', order = config['order'])
+        timings['t_components'] = time.perf_counter() - t0
+
+    if config['animate']:
+        t0 = time.perf_counter()
+        packet.animate(20, 0.1, x_evo, save = True, pathname = path + '_animation.gif')
+        plt.close('all')
+        timings['t_animation'] = time.perf_counter() - t0
+
+    if config['spectra']:
+        t0 = time.perf_counter()
+        t = np.arange(-5, 15, 1/60)
         fftfreqs_0, ffts_0, powers_0 = packet.power_spectrum(t, 0, plot = False)
         fftfreqs_x, ffts_x, powers_x = packet.power_spectrum(t, x_f, plot = False)
-    
-    
-        plt.figure(figsize = (10,5))
+        np.savez(path + '_spectra.npz', t = t, x_f = x_f, fftfreqs = fftfreqs_0,
+                 ffts_0 = ffts_0, powers_0 = powers_0, ffts_x = ffts_x, powers_x = powers_x)
+        fig = plt.figure(figsize = (10,5))
         plt.plot(fftfreqs_0, powers_0, color = 'crimson', label = 'Power spectrum at x = 0 m', alpha = 0.5)
         plt.plot(fftfreqs_x, powers_x, color = 'teal', label = 'Power spectrum at x = {} m'.format(x_f), alpha = 0.5)
         plt.title('Comparison of the 2 power spectra')
@@ -430,15 +507,337 @@ elif spectrum_x == 'y':
         plt.ylabel('Power (a.u.)')
         plt.xlim((0, 3))
         plt.legend()
+        fig.savefig(path + '_spectra.png')
+        plt.close(fig)
+        timings['t_spectra'] = time.perf_counter() - t0
+
+    timings['t_total'] = time.perf_counter() - start
+    return timings
+
+
+def batch_session(args):
+    """
+    This function runs the grid of configurations of the batch mode in a process pool and
+    writes the timings of each configuration in outdir/summary.csv. A configuration that 
+    fails does not stop the others: its error is written in the column 'error' of the 
+    summary (empty for the configurations that succeeded).
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Parsed command line arguments.
+
+    Returns
+    -------
+    summary : pandas.DataFrame
+        Configurations and timings of the batch.
+
+    """
+    options = batch_options(args)
+    os.makedirs(options['outdir'], exist_ok = True)
+    configs = []
+    grid = list(itertools.product(options['freq_dist'], options['ampl_dist'], 
+                                  options['disp_rel'], options['n_comp']))
+    #independent seeds: the forked workers would otherwise share the same random state
+    seeds = [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(options['seed']).spawn(len(grid))]
+    for (fd, ad, dr, n_comp), seed in zip(grid, seeds):
+        config = {key: options[key] for key in ('outdir', 'bins', 'order', 'animate', 'spectra')}
+        config.update(seed = seed, name = 'fd{}_ad{}_dr{}_n{}'.format(fd, ad, dr, n_comp), freq_dist = fd, 
+                      ampl_dist = ad, disp_rel = dr, n_comp = int(n_comp))
+        #invalid choices are reported before starting the pool
+        if (fd not in (1, 2)) or (ad not in (1, 2)) or (dr not in (1, 2, 3, 4)):
+            raise ValueError("'{}' is not a valid configuration".format(config['name']))
+        configs.append(config)
+
+    results = []
+    print('Running {} configurations...'.format(len(configs)))
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers = options['workers']) as pool:
+            futures = {pool.submit(run_configuration, config): config for config in configs}
+            for future in tqdm(concurrent.futures.as_completed(futures), total = len(futures)):
+                try:
+                    timings = future.result()
+                    timings['error'] = ''
+                except Exception as exc:
+                    timings = dict(futures[future])
+                    timings['error'] = '{}: {}'.format(type(exc).__name__, exc)
+                    print("Configuration {} failed: {}".format(timings['name'], timings['error']))
+                results.append(timings)
+    finally:
+        #the summary is written also if the batch is interrupted
+        if len(results) > 0:
+            summary = pd.DataFrame(results).sort_values('name').drop(columns = 'outdir').reset_index(drop = True)
+        else:
+            summary = pd.DataFrame(columns = ['name', 'error'])
+        summary.to_csv(os.path.join(options['outdir'], 'summary.csv'), index = False)
+    return summary
+
+
+# Background precomputation
+
+class prefetcher:
+    """
+    Class running the likely next calculations of the interactive session in a thread pool
+    while the user answers the questions.
+
+    ...
+
+    Methods
+    -------
+    submit(key, func, *args, **kwargs)
+    take(key)
+    cancel(*keys)
+    close()
+    """
+    def __init__(self, workers = 2):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers = workers)
+        self.jobs = {} #key: (future, stop event)
+
+    def submit(self, key, func, *args, **kwargs):
+        """
+        This method schedules func(*args, **kwargs). If stoppable = True, a threading.Event
+        is passed to func as the keyword argument stop, so that a running job can be 
+        interrupted.
+        """
+        stop = threading.Event()
+        if kwargs.pop('stoppable', False):
+            kwargs['stop'] = stop
+        self.jobs[key] = (self.executor.submit(func, *args, **kwargs), stop)
+
+    def take(self, key):
+        """
+        This method waits for the job and returns its result (None if the job was never
+        submitted).
+        """
+        if key not in self.jobs:
+            return None
+        future, stop = self.jobs.pop(key)
+        return future.result()
+
+    def cancel(self, *keys):
+        """
+        This method cancels the jobs that are still waiting and stops the running ones.
+        """
+        for key in keys:
+            if key in self.jobs:
+                future, stop = self.jobs.pop(key)
+                stop.set()
+                future.cancel()
+
+    def close(self):
+        """
+        This method cancels all the remaining jobs and shuts down the thread pool.
+        """
+        self.cancel(*list(self.jobs))
+        self.executor.shutdown(wait = False, cancel_futures = True)
+
+
+def start_prefetch(packet, x_evo, x_f, t, t_long):
+    """
+    This function starts the background calculation of the animation frames over x_evo and
+    of the waveforms needed for the power spectra at x = 0 and x = x_f, in the order in 
+    which the interactive session asks for them.
+
+    Returns
+    -------
+    jobs : prefetcher
+        Background jobs, with keys 'frames', 'wave_t_0', 'wave_t_x', 'wave_t_0_long' and
+        'wave_t_x_long'.
+    """
+    jobs = prefetcher(workers = min(2, os.cpu_count() or 1))
+    jobs.submit('frames', packet.animation_frames, 20, 0.1, x_evo, progress = False, stoppable = True)
+    jobs.submit('wave_t_0', packet.generate_wave_t, t, 0, progress = False, stoppable = True)
+    jobs.submit('wave_t_x', packet.generate_wave_t, t, x_f, progress = False, stoppable = True)
+    jobs.submit('wave_t_0_long', packet.generate_wave_t, t_long, 0, progress = False, stoppable = True)
+    jobs.submit('wave_t_x_long', packet.generate_wave_t, t_long, x_f, progress = False, stoppable = True)
+    return jobs
+
+
+# Interactive mode
+
+def interactive_session(args):
+    choices = []
+    for key in ('freq_dist', 'ampl_dist', 'disp_rel'):
+        value = DEFAULTS[key] if getattr(args, key) is None else getattr(args, key)
+        if len(value) != 1:
+            raise ValueError("Only one value of --{} can be given in interactive mode".format(key))
+        choices.append(value[0])
+    fd, ad, dr = choices
+
+
+    # Generating the frequencies and the amplitudes
+    n_comp = input('How many frequencies and amplitudes do you want to generate? ')
+    freq, ampl, x_freq_dist, freq_dist = generate_components(fd, ad, int(n_comp))
+
+
+    f_hist = input('Do you want to see the frequencies distribution histogram? [y/n] ')
+    if (f_hist != 'y') and (f_hist != 'n'):
+        raise ValueError("'{}' is not a valid answer".format(f_hist))
+    if f_hist == 'y':
+        bins = input('Please insert the number of bins you want to display: ')
+        plt.figure(figsize = (10,5))
+        plt.hist(freq, bins = int(bins), color = 'crimson', density = True, label = 'f dist.')
+        plt.plot(x_freq_dist, freq_dist, color = 'teal', label = 'f. prob. dist.')
+        plt.xlabel('f (Hz)')
+        plt.ylabel('p(f)')
+        plt.title('Frequencies distribution histogram (normalized)')
+        plt.legend()
+        plt.show()
+
+    A_hist = input('Do you want to see the amplitudes distribution histogram? [y/n] ')
+    if (A_hist != 'y') and (A_hist != 'n'):
+        raise ValueError("'{}' is not a valid answer".format(A_hist), density = True)
+    if A_hist == 'y':
+        bins = input('Please insert the number of bins you want to display: ')
+        plt.figure(figsize = (10,5))
+        plt.hist(ampl, bins = int(bins), color = 'crimson')
+        plt.xlabel('A (a. u.)')
+        plt.ylabel('N. occurrencies')
+        plt.title('Amplitudes distribution histogram')
+        plt.show()
+
+
+    f_hist_w = input('Do you want to see the weighed frequencies distribution histogram? [y/n] ')
+    if (f_hist_w != 'y') and (f_hist_w != 'n'):
+        raise ValueError("'{}' is not a valid answer".format(f_hist_w))
+    if f_hist_w == 'y':
+        bins = input('Please insert the number of bins you want to display: ')
+        plt.figure(figsize = (10,5))
+        plt.hist(freq, bins = int(bins), weights = ampl, color = 'crimson')
+        plt.xlabel('f (Hz)')
+        plt.ylabel('N. occurrencies')
+        plt.title('Frequencies distribution histogram')
+        plt.show()
+
+
+
+    # Creating the packet
+
+    packet, x_0, x_evo, x_f = create_packet(dr, freq, ampl)
+
+    t = np.arange(-5, 5, 1/60)
+    t_long = np.arange(-5, 15, 1/60)
+
+    # the waveform at t=0 is shown first, the background jobs would only slow it down
+    wf_0 = packet.generate_wave_x(x_0, 0)
+    jobs = start_prefetch(packet, x_evo, x_f, t, t_long) if args.prefetch else prefetcher(workers = 1)
+    try:
+        interactive_steps(packet, freq, ampl, x_0, x_evo, x_f, t, t_long, wf_0, jobs)
+    finally:
+        jobs.close()
+
+
+def interactive_steps(packet, freq, ampl, x_0, x_evo, x_f, t, t_long, wf_0, jobs):
+
+    # Plotting the packet along x-axis at t=0
+
+
+    packet.wave(axis = 'x', x = x_0, t=0, y = wf_0)
+
+
+    # Displaying the components
+
+    comp = input('Do you want to print a dataframe of the freq. and amplitudes of the package? [y/n] ')
+    if (comp != 'y') and (comp != 'n'):
+        raise ValueError("'{}' is not a valid answer".format(comp))
+    elif comp == 'y':
+        order_df = input('Do you want them to be printed in the order of increasing frequencies [1] or decreasing amplitudes [2]? ')
+        if (order_df != '1') and (order_df != '2'):
+            raise ValueError("'{}' is not a valid answer".format(order_df))
+        elif order_df == '1':
+            order = 'freq'
+        else:
+            order = 'ampl'
+        packet.display_components_df(order = order)
+
+    # Animating the time evolution of the packet
+
+    anim = input('Do you want to see the animation of the time evolution of the packet? [y/n] ')
+
+    if (anim != 'y') and (anim != 'n'):
+        raise ValueError("'{}' is not a valid answer".format(anim))
+    elif anim == 'n':
+        jobs.cancel('frames')
+    elif anim == 'y':
+        sv = False
+        path = ''
+        save = input('Do you want to save the animation? [y/n] ')
+        if (save != 'y') and (save != 'n'):
+            raise ValueError("'{}' is not a valid answer".format(save))
+        elif save == 'y':
+            sv = True
+            path = input('Insert the pathname of the file you want to save. Please include the file name and the extension (.gif): ')
+
+        packet.animate(20, 0.1, x_evo, save = sv, pathname = path, frames = jobs.take('frames'))
+
+
+    # Plotting the Fourier power spectrum
+
+
+    spectrum = input('Do you want to see the Fourier power spectrum of the packet at x=0? [y/n] ')
+    if (spectrum != 'y') and (spectrum != 'n'):
+        raise ValueError("'{}' is not a valid answer".format(spectrum))
+    elif spectrum == 'n':
+        jobs.cancel('wave_t_0')
+    elif spectrum == 'y':
+        y_0 = jobs.take('wave_t_0')
+        packet.wave(axis = 't', t = t, x=0, y = y_0)
+        fftfreqs_0, ffts_0, powers_0 = packet.power_spectrum(t, 0, plot = True, y = y_0)
+
+        #Plotting the real part 
+
+        plt.figure(figsize = (10,5))
+        plt.plot(fftfreqs_0, 2*abs(ffts_0.real)/len(t), color = 'crimson', label = 'Real part spectrum')
+        plt.title('Real part spectrum at x = {} m'.format(0))
+        plt.hist(freq, bins = 30, weights = ampl, color = 'teal', label = 'f dist. weighed hist.')
+        plt.xlabel('f (Hz)')
+        plt.ylabel('Real part (a.u.)')
+        plt.xlim((0, 3))
+        plt.legend()
         plt.show()
-    
 
-    
 
 
+    spectrum_x = input('Do you want to see the Fourier power spectrum of the packet at another position? [y/n] ')
+    if (spectrum_x != 'y') and (spectrum_x != 'n'):
+        raise ValueError("'{}' is not a valid answer".format(spectrum_x))
+    elif spectrum_x == 'n':
+        jobs.cancel('wave_t_x', 'wave_t_0_long', 'wave_t_x_long')
+    elif spectrum_x == 'y':
+        y_x = jobs.take('wave_t_x')
+        packet.wave(axis = 't', t = t, x=x_f, y = y_x)
+        fftfreqs_x, ffts_x, powers_x = packet.power_spectrum(t, x_f, plot = True, y = y_x)
+
 
 
+        comparison = input('Do you want to compare the power spectra at the two positions? [y/n] ')
+        if (comparison != 'y') and (comparison != 'n'):
+            raise ValueError("'{}' is not a valid answer".format(comparison))
+        elif comparison == 'n':
+            jobs.cancel('wave_t_0_long', 'wave_t_x_long')
+        elif comparison == 'y':
 
+            t = t_long
 
+            fftfreqs_0, ffts_0, powers_0 = packet.power_spectrum(t, 0, plot = False, y = jobs.take('wave_t_0_long'))
+            fftfreqs_x, ffts_x, powers_x = packet.power_spectrum(t, x_f, plot = False, y = jobs.take('wave_t_x_long'))
 
 
+            plt.figure(figsize = (10,5))
+            plt.plot(fftfreqs_0, powers_0, color = 'crimson', label = 'Power spectrum at x = 0 m', alpha = 0.5)
+            plt.plot(fftfreqs_x, powers_x, color = 'teal', label = 'Power spectrum at x = {} m'.format(x_f), alpha = 0.5)
+            plt.title('Comparison of the 2 power spectra')
+            plt.xlabel('f (Hz)')
+            plt.ylabel('Power (a.u.)')
+            plt.xlim((0, 3))
+            plt.legend()
+            plt.show()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    if args.batch:
+        summary = batch_session(args)
+        print(summary)
+    else:
+        interactive_session(args)